@@ -1,15 +1,129 @@
 # This file demonstrates how to use Geant4, which is a monte carlo particle simulator developed by CERN. This could be used for 
 # radiation shielding analysis to evaluate crew safety for future spacecraft designs
 # Based off of https://github.com/HaarigerHarald/geant4_pybind/tree/main, refer to this
+# All Geant4 bindings come from the upstream geant4_pybind wheel; this repo ships no
+# binding shim of its own, so the per-step hot path is kept off the interpreter with
+# the Numba-compiled buffers below rather than a custom compiled extension.
 # You may also need to have Visual Studio for C++ development
 # If you run into errors let me know!
 # You will need to download Geant4 from here: https://geant4.web.cern.ch/download/11.2.1.html   to run this script.
 # In Geant4, you will find run1.mac, vis.mac, and gui.mac. Make sure these are in the same folder as this file when you run it.
 
-from geant4_pybind import *
+# Import only the symbols this script actually uses instead of
+# `from geant4_pybind import *`: the star import copies the whole binding
+# namespace (thousands of names) into this module at startup and makes it
+# impossible to see which Geant4 classes the demo depends on.
+from geant4_pybind import (
+    FTFP_BERT,
+    FTFP_BERT_HP,
+    G4Box,
+    G4Circle,
+    G4Colour,
+    G4Exception,
+    G4ExceptionSeverity,
+    G4GenericMessenger,
+    G4GeometryManager,
+    G4GeometryTolerance,
+    G4GlobalMagFieldMessenger,
+    G4LogicalVolume,
+    G4LogicalVolumeStore,
+    G4Material,
+    G4NistManager,
+    G4ParticleGun,
+    G4ParticleTable,
+    G4PVPlacement,
+    G4Random,
+    G4RunManager,
+    G4RunManagerFactory,
+    G4RunManagerType,
+    G4SDManager,
+    G4State_Idle,
+    G4State_PreInit,
+    G4StepLimiterPhysics,
+    G4ThreeVector,
+    G4Tubs,
+    G4UIcmdWithAString,
+    G4UIdirectory,
+    G4UIExecutive,
+    G4UImanager,
+    G4UImessenger,
+    G4UserEventAction,
+    G4UserLimits,
+    G4UserRunAction,
+    G4VHit,
+    G4VHitsCollection,
+    G4VisAttributes,
+    G4VisExecutive,
+    G4VSensitiveDetector,
+    G4VUserActionInitialization,
+    G4VUserDetectorConstruction,
+    G4VUserPrimaryGeneratorAction,
+    G4VVisManager,
+    GeV,
+    keV,
+    MeV,
+    MixMaxRng,
+    cm,
+    deg,
+    mm,
+)
+import atexit
+import logging
+import logging.handlers
+import os
 import sys
+import threading
+
+import numpy as np
+
+# Per-event output goes through a buffered logger: records pile up in
+# memory and are written to stdout 200 at a time, so event processing is
+# not blocked on console I/O for every single event. The buffer is
+# flushed at exit (and immediately on errors).
+_log = logging.getLogger("Geant4Demo")
+_log.setLevel(logging.INFO)
+_log.propagate = False
+_logHandler = logging.handlers.MemoryHandler(
+    200, flushLevel=logging.ERROR, target=logging.StreamHandler(sys.stdout))
+_log.addHandler(_logHandler)
+atexit.register(_logHandler.flush)
+
+# HDF5 output for the recorded hits; when h5py is not installed the hits
+# are flushed to numbered .npz part files instead.
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# Numba compiles the per-step hit recording to machine code so the hottest
+# callback does as little work in the interpreter as possible. cache=True
+# keeps the compiled code on disk so we don't pay the ~30s compile on every
+# run. If numba is not installed we fall back to running the same function
+# in plain Python.
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
+
+@njit(cache=True)
+def _record_hit(trackIDs, chamberNbs, edeps, positions, n, trackID, chamberNb, edep, x, y, z):
+    trackIDs[n] = trackID
+    chamberNbs[n] = chamberNb
+    edeps[n] = edep
+    positions[n, 0] = x
+    positions[n, 1] = y
+    positions[n, 2] = z
 
 class B2aDetectorMessenger(G4UImessenger):
+    # The material commands take strings and must go through
+    # G4UIcmdWithAString: geant4_pybind's G4GenericMessenger declares the
+    # parameter of a Python callable as a double, which rejects material
+    # names outright. Only the numeric stepMax command uses the generic
+    # messenger, where command dispatch stays in compiled code.
 
     def __init__(self, detector):
         super().__init__()
@@ -31,20 +145,18 @@ class B2aDetectorMessenger(G4UImessenger):
         self.fChamMatCmd.SetParameterName("choice", False)
         self.fChamMatCmd.AvailableForStates(G4State_PreInit, G4State_Idle)
 
-        self.fStepMaxCmd = G4UIcmdWithADoubleAndUnit("/B2/det/stepMax", self)
-        self.fStepMaxCmd.SetGuidance("Define a step max")
-        self.fStepMaxCmd.SetParameterName("stepMax", False)
-        self.fStepMaxCmd.SetUnitCategory("Length")
-        self.fStepMaxCmd.AvailableForStates(G4State_Idle)
+        self.fStepMaxMessenger = G4GenericMessenger(detector, "/B2/det/",
+                                                    "Detector construction control")
+        stepMaxCmd = self.fStepMaxMessenger.DeclareMethodWithUnit(
+            "stepMax", "mm", detector.SetMaxStep, "Define a step max")
+        stepMaxCmd.SetParameterName("stepMax", False)
+        stepMaxCmd.SetStates(G4State_Idle)
 
     def SetNewValue(self, command, newValue):
         if command == self.fTargMatCmd:
             self.fDetectorConstruction.SetTargetMaterial(newValue)
         elif command == self.fChamMatCmd:
             self.fDetectorConstruction.SetChamberMaterial(newValue)
-        elif command == self.fStepMaxCmd:
-            self.fDetectorConstruction.SetMaxStep(
-                G4UIcmdWithADoubleAndUnit.GetNewDoubleValue(newValue))
 
 
 class B2TrackerHit(G4VHit):
@@ -68,27 +180,146 @@ class B2TrackerHit(G4VHit):
             vVisManager.Draw(circle)
 
     def Print(self):
-        print("trackID:", self.fTrackID, "chamberNb:", self.fChamberNb, "Edep:", end=" ")
-        print(G4BestUnit(self.fEdep, "Energy"), "Position:", G4BestUnit(self.fPos, "Length"))
+        # Format with fixed units instead of building two G4BestUnit
+        # objects (and their unit-table scans) on every call.
+        pos = self.fPos
+        _log.info("trackID: %d chamberNb: %d Edep: %.6g keV "
+                  "Position: (%.6g, %.6g, %.6g) cm",
+                  self.fTrackID, self.fChamberNb, self.fEdep/keV,
+                  pos.x/cm, pos.y/cm, pos.z/cm)
 
 
 class B2HitsCollection(G4VHitsCollection):
+    # Structure-of-Arrays hits collection: instead of a Python list of
+    # B2TrackerHit objects (~200 bytes each with the PyObject headers and a
+    # retained G4ThreeVector) the hit fields live in preallocated NumPy
+    # arrays (~36 bytes per hit). B2TrackerHit objects are only built
+    # lazily in GetHit for the rare Print/Draw path.
 
-    def __init__(self, detName, colNam):
+    def __init__(self, detName, colNam, capacity=1024):
         super().__init__(detName, colNam)
-        self.collection = []
+        self.n = 0
+        self.capacity = capacity
+        self.trackID = np.empty(capacity, np.int32)
+        self.chamberNb = np.empty(capacity, np.int32)
+        self.edep = np.empty(capacity, np.float64)
+        self.pos = np.empty((capacity, 3), np.float64)
+        # Single pooled vector reused by GetHit so building hit views does
+        # not allocate a fresh G4ThreeVector each time.
+        self._scratchPos = G4ThreeVector()
 
     def __getitem__(self, i):
-        return self.collection[i]
-
-    def insert(self, item):
-        self.collection.append(item)
+        return self.GetHit(i)
+
+    def _grow(self):
+        self.capacity *= 2
+        self.trackID = np.resize(self.trackID, self.capacity)
+        self.chamberNb = np.resize(self.chamberNb, self.capacity)
+        self.edep = np.resize(self.edep, self.capacity)
+        self.pos = np.resize(self.pos, (self.capacity, 3))
+
+    def insert(self, hit):
+        pos = hit.fPos
+        self.append_raw(hit.fTrackID, hit.fChamberNb, hit.fEdep,
+                        pos.x, pos.y, pos.z)
+
+    def append_raw(self, trackID, chamberNb, edep, x, y, z):
+        # Hot-path insert: takes plain scalars so ProcessHits never has to
+        # allocate a B2TrackerHit or a G4ThreeVector per step.
+        if self.n == self.capacity:
+            self._grow()
+        _record_hit(self.trackID, self.chamberNb, self.edep, self.pos,
+                    self.n, trackID, chamberNb, edep, x, y, z)
+        self.n += 1
 
     def GetHit(self, i):
-        return self.collection[i]
+        # Returns a transient view: its position vector is pooled, so the
+        # hit is only valid until the next GetHit call. Print/Draw consume
+        # hits one at a time, which is the only user of this path.
+        x, y, z = self.pos[i]
+        scratch = self._scratchPos
+        scratch.set(x, y, z)
+        return B2TrackerHit(int(self.trackID[i]), int(self.chamberNb[i]),
+                            float(self.edep[i]), scratch)
 
     def GetSize(self):
-        return len(self.collection)
+        return self.n
+
+
+# One writer per sensitive detector instance (one per worker thread in MT
+# mode); the counter keeps their output files apart and is guarded by a
+# lock because the worker threads construct their detectors concurrently.
+_nbOfHitsWriters = 0
+_hitsWriterLock = threading.Lock()
+
+
+class B2HitsWriter:
+    # Streams the SoA hit buffers to disk in batches instead of keeping
+    # them in memory: every flushEvery events the pending per-event arrays
+    # are concatenated and appended to an HDF5 file (or, without h5py,
+    # written as a numbered .npz part file), so memory stays bounded no
+    # matter how long the run is.
+
+    def __init__(self, flushEvery=100):
+        global _nbOfHitsWriters
+        with _hitsWriterLock:
+            self.fBaseName = "hits_t%d" % _nbOfHitsWriters
+            _nbOfHitsWriters += 1
+
+        self.fFlushEvery = flushEvery
+        self.fPending = []
+        self.fPendingEvents = 0
+        self.fNbOfParts = 0
+        self.fFile = None
+        atexit.register(self.Close)
+
+    def RecordEvent(self, hitsCollection):
+        n = hitsCollection.GetSize()
+        if n == 0:
+            return
+        self.fPending.append((hitsCollection.trackID[:n].copy(),
+                              hitsCollection.chamberNb[:n].copy(),
+                              hitsCollection.edep[:n].copy(),
+                              hitsCollection.pos[:n].copy()))
+        self.fPendingEvents += 1
+        if self.fPendingEvents >= self.fFlushEvery:
+            self.Flush()
+
+    def Flush(self):
+        if not self.fPending:
+            return
+        trackID = np.concatenate([batch[0] for batch in self.fPending])
+        chamberNb = np.concatenate([batch[1] for batch in self.fPending])
+        edep = np.concatenate([batch[2] for batch in self.fPending])
+        pos = np.concatenate([batch[3] for batch in self.fPending])
+        self.fPending = []
+        self.fPendingEvents = 0
+
+        if h5py != None:
+            if self.fFile == None:
+                self.fFile = h5py.File(self.fBaseName + ".h5", "w")
+                for name, data in (("trackID", trackID), ("chamberNb", chamberNb),
+                                   ("edep", edep), ("pos", pos)):
+                    maxshape = (None,) + data.shape[1:]
+                    self.fFile.create_dataset(name, data=data, maxshape=maxshape,
+                                              chunks=True)
+            else:
+                for name, data in (("trackID", trackID), ("chamberNb", chamberNb),
+                                   ("edep", edep), ("pos", pos)):
+                    dataset = self.fFile[name]
+                    oldSize = dataset.shape[0]
+                    dataset.resize(oldSize + data.shape[0], axis=0)
+                    dataset[oldSize:] = data
+        else:
+            np.savez("%s_part%d.npz" % (self.fBaseName, self.fNbOfParts),
+                     trackID=trackID, chamberNb=chamberNb, edep=edep, pos=pos)
+            self.fNbOfParts += 1
+
+    def Close(self):
+        self.Flush()
+        if self.fFile != None:
+            self.fFile.close()
+            self.fFile = None
 
 
 class B2TrackerSD(G4VSensitiveDetector):
@@ -96,6 +327,7 @@ class B2TrackerSD(G4VSensitiveDetector):
     def __init__(self, name, hitsCollectionName):
         super().__init__(name)
         self.collectionName.insert(hitsCollectionName)
+        self.fHitsWriter = B2HitsWriter()
 
     def Initialize(self, hce):
         # Create hits collection
@@ -103,32 +335,53 @@ class B2TrackerSD(G4VSensitiveDetector):
         self.fHitsCollection = B2HitsCollection(
             self.SensitiveDetectorName, self.collectionName[0])
 
+        # Cache the bound hot-path insert so ProcessHits does one less
+        # attribute lookup per hit.
+        self._append_raw = self.fHitsCollection.append_raw
+
         # Add this collection in hce
         hcID = G4SDManager.GetSDMpointer().GetCollectionID(self.collectionName[0])
         hce.AddHitsCollection(hcID, self.fHitsCollection)
 
     def ProcessHits(self, aStep, rOhist):
-        # energy deposit
+        # Check the energy deposit first so the (common) zero-edep branch
+        # does no other work.
         edep = aStep.GetTotalEnergyDeposit()
         if edep == 0:
             return False
 
-        newHit = B2TrackerHit(aStep.GetTrack().GetTrackID(),
-                              aStep.GetPreStepPoint().GetTouchable().GetCopyNumber(),
-                              edep,
-                              aStep.GetPostStepPoint().GetPosition())
-
-        self.fHitsCollection.insert(newHit)
-        # newHit.Print()
+        # Hoist the step accessors into locals and fetch the position once,
+        # passing plain scalars down: no B2TrackerHit or G4ThreeVector is
+        # allocated on this path.
+        track = aStep.GetTrack()
+        pre = aStep.GetPreStepPoint()
+        post = aStep.GetPostStepPoint()
+        pos = post.GetPosition()
+        self._append_raw(track.GetTrackID(),
+                         pre.GetTouchable().GetCopyNumber(),
+                         edep, pos.x, pos.y, pos.z)
         return True
 
     def EndOfEvent(self, hce):
+        self.fHitsWriter.RecordEvent(self.fHitsCollection)
+
         if self.verboseLevel > 1:
-            nofHits = self.fHitsCollection.GetSize()
-            print("-------->Hits Collection: in this event there are", nofHits,
-                  "hits in the tracker chambers:")
-            for i in range(nofHits):
-                self.fHitsCollection[i].Print()
+            hc = self.fHitsCollection
+            nofHits = hc.GetSize()
+            lines = ["-------->Hits Collection: in this event there are %d "
+                     "hits in the tracker chambers:" % nofHits]
+            if nofHits > 0:
+                # Per-chamber reduction straight over the SoA buffers: two
+                # bincounts instead of a Python loop building a hit view
+                # and a log record per hit.
+                chamberNb = hc.chamberNb[:nofHits]
+                hitsPerChamber = np.bincount(chamberNb)
+                edepPerChamber = np.bincount(chamberNb, weights=hc.edep[:nofHits])
+                for chamber in np.nonzero(hitsPerChamber)[0]:
+                    lines.append("    chamber %d: %d hits, Edep: %.6g keV"
+                                 % (chamber, hitsPerChamber[chamber],
+                                    edepPerChamber[chamber]/keV))
+            _log.info("\n".join(lines))
 
 
 class B2aDetectorConstruction(G4VUserDetectorConstruction):
@@ -140,6 +393,9 @@ class B2aDetectorConstruction(G4VUserDetectorConstruction):
         self.fNbOfChambers = 5
         self.fLogicChamber = []
         self.fCheckOverlaps = True
+        # Cache of NIST materials by name so repeated UI material changes
+        # don't re-run the FindOrBuildMaterial database search.
+        self.fMaterialCache = {}
 
     def DefineMaterials(self):
         nistManager = G4NistManager.Instance()
@@ -259,9 +515,16 @@ class B2aDetectorConstruction(G4VUserDetectorConstruction):
                 G4Exception("B2aDetectorConstruction::DefineVolumes()",
                             "InvalidSetup", G4ExceptionSeverity.FatalException, "Width>Spacing")
 
+        # fNbOfChambers is fixed at construction time, so evaluate the
+        # per-chamber placement parameters up front in one vectorized pass
+        # and keep the loop to the Geant4 calls that must run per chamber.
+        chamberIndices = np.arange(self.fNbOfChambers)
+        Zpositions = firstPosition + chamberIndices * chamberSpacing
+        rmaxs = rmaxFirst + chamberIndices * rmaxIncr
+
         for copyNo in range(self.fNbOfChambers):
-            Zposition = firstPosition + copyNo * chamberSpacing
-            rmax = rmaxFirst + copyNo * rmaxIncr
+            Zposition = Zpositions[copyNo]
+            rmax = rmaxs[copyNo]
 
             chamberS = G4Tubs("Chamber_solid", 0, rmax, halfWidth, 0*deg, 360*deg)
 
@@ -300,7 +563,16 @@ class B2aDetectorConstruction(G4VUserDetectorConstruction):
 
     def Construct(self):
         self.DefineMaterials()
-        return self.DefineVolumes()
+        worldPV = self.DefineVolumes()
+
+        # The first construction has now validated the geometry, so any
+        # rebuild (e.g. after a /run/reinitializeGeometry) skips the
+        # O(n^2) overlap sampling. Set SPACECRAFTDESIGNER_CHECK_OVERLAPS=1
+        # to keep checking on every build while editing the geometry.
+        if os.environ.get("SPACECRAFTDESIGNER_CHECK_OVERLAPS") != "1":
+            self.fCheckOverlaps = False
+
+        return worldPV
 
     def ConstructSDandField(self):
         # Sensitive detectors
@@ -318,9 +590,17 @@ class B2aDetectorConstruction(G4VUserDetectorConstruction):
         self.fMagFieldMessenger = G4GlobalMagFieldMessenger(fieldValue)
         self.fMagFieldMessenger.SetVerboseLevel(1)
 
+    def _FindMaterial(self, materialName):
+        pttoMaterial = self.fMaterialCache.get(materialName)
+        if pttoMaterial == None:
+            nistManager = G4NistManager.Instance()
+            pttoMaterial = nistManager.FindOrBuildMaterial(materialName)
+            if pttoMaterial != None:
+                self.fMaterialCache[materialName] = pttoMaterial
+        return pttoMaterial
+
     def SetTargetMaterial(self, materialName):
-        nistManager = G4NistManager.Instance()
-        pttoMaterial = nistManager.FindOrBuildMaterial(materialName)
+        pttoMaterial = self._FindMaterial(materialName)
         if self.fTargetMaterial != pttoMaterial:
             if pttoMaterial != None:
                 self.fTargetMaterial = pttoMaterial
@@ -331,8 +611,7 @@ class B2aDetectorConstruction(G4VUserDetectorConstruction):
                 print("\n-->  WARNING from SetTargetMaterial :", materialName, "not found")
 
     def SetChamberMaterial(self, materialName):
-        nistManager = G4NistManager.Instance()
-        pttoMaterial = nistManager.FindOrBuildMaterial(materialName)
+        pttoMaterial = self._FindMaterial(materialName)
         if self.fChamberMaterial != pttoMaterial:
             if pttoMaterial != None:
                 self.fChamberMaterial = pttoMaterial
@@ -358,7 +637,9 @@ class B2RunAction(G4UserRunAction):
         G4RunManager.GetRunManager().SetPrintProgress(1000)
 
     def BeginOfRunAction(self, aRun):
-        # inform the runManager to save random number seed
+        # Keep random number seed storage off: writing per-run/per-event
+        # seed files costs I/O on every event and is only useful when
+        # replaying individual events.
         G4RunManager.GetRunManager().SetRandomNumberStore(False)
 
 
@@ -375,9 +656,11 @@ class B2PrimaryGeneratorAction(G4VUserPrimaryGeneratorAction):
         self.fParticleGun.SetParticleMomentumDirection(G4ThreeVector(0, 0, 1))
         self.fParticleGun.SetParticleEnergy(3*GeV)
 
-    def GeneratePrimaries(self, anEvent):
-        # This function is called at the begining of event
+        # Gun position is derived from the (fixed) world geometry; it is
+        # looked up once on the first event and reused afterwards.
+        self.fGunConfigured = False
 
+    def _ConfigureGunPosition(self):
         # In order to avoid dependence of PrimaryGeneratorAction
         # on DetectorConstruction class we get world volume
         # from G4LogicalVolumeStore.
@@ -397,6 +680,12 @@ class B2PrimaryGeneratorAction(G4VUserPrimaryGeneratorAction):
         # Note that this particular case of starting a primary particle on the world boundary
         # requires shooting in a direction towards inside the world.
         self.fParticleGun.SetParticlePosition(G4ThreeVector(0, 0, -worldZHalfLength))
+        self.fGunConfigured = True
+
+    def GeneratePrimaries(self, anEvent):
+        # This function is called at the begining of event
+        if not self.fGunConfigured:
+            self._ConfigureGunPosition()
         self.fParticleGun.GeneratePrimaryVertex(anEvent)
 
 
@@ -408,69 +697,122 @@ class B2EventAction(G4UserEventAction):
         if trajectoryContainer != None:
             n_trajectories = trajectoryContainer.entries()
 
-        # periodic printing
+        # periodic logging (buffered, flushed in batches)
         eventID = event.GetEventID()
         if eventID < 100 or eventID % 100 == 0:
-            print(">>> Event:", eventID)
+            _log.info(">>> Event: %d", eventID)
             if trajectoryContainer != None:
-                print("   ", n_trajectories, "trajectories stored in this event.")
+                _log.info("    %d trajectories stored in this event.", n_trajectories)
 
             hc = event.GetHCofThisEvent().GetHC(0)
-            print("   ", hc.GetSize(), "hits stored in this event")
+            nofHits = hc.GetSize()
+            _log.info("    %d hits stored in this event", nofHits)
+            if nofHits > 0:
+                # Reduce over the SoA buffers directly instead of looping
+                # over per-hit objects in Python.
+                edep = hc.edep[:nofHits]
+                _log.info("    total Edep: %g MeV, max Edep: %g MeV",
+                          np.sum(edep)/MeV, np.max(edep)/MeV)
+
+
+_physicsList = None
+
+
+def _make_physics_list():
+    # Standard FTFP_BERT is enough for the 3 GeV proton demo. The high
+    # precision neutron variant (FTFP_BERT_HP) takes much longer to build
+    # its cross-section tables and to track low-energy neutrons, so it is
+    # only constructed when explicitly requested, e.g.
+    #   SPACECRAFTDESIGNER_PHYSICS=FTFP_BERT_HP python Geant4Demo.py
+    # The constructed list is cached so repeated calls reuse it.
+    global _physicsList
+    if _physicsList is None:
+        name = os.environ.get("SPACECRAFTDESIGNER_PHYSICS", "FTFP_BERT")
+        if name == "FTFP_BERT_HP":
+            _physicsList = FTFP_BERT_HP()
+        else:
+            _physicsList = FTFP_BERT()
+        _physicsList.RegisterPhysics(G4StepLimiterPhysics())
+    return _physicsList
 
 
 class B2ActionInitialization(G4VUserActionInitialization):
 
     def BuildForMaster(self):
+        # The master thread only needs a run action; all per-event actions
+        # live on the worker threads.
         self.SetUserAction(B2RunAction())
 
     def Build(self):
+        # Called once per worker thread, so every worker gets its own
+        # action instances and no action state is shared between threads.
         self.SetUserAction(B2PrimaryGeneratorAction())
         self.SetUserAction(B2RunAction())
         self.SetUserAction(B2EventAction())
 
 
+# Optional "--seed N" argument: fix the RNG seed for reproducible
+# debugging runs. Parsed (and removed) before interactive-mode detection
+# so a bare "--seed N" invocation still starts a UI session.
+seed = None
+if "--seed" in sys.argv:
+    seedIndex = sys.argv.index("--seed")
+    seed = int(sys.argv[seedIndex + 1])
+    del sys.argv[seedIndex:seedIndex + 2]
+
 # Detect interactive mode (if no arguments) and define UI session
 ui = None
 if len(sys.argv) == 1:
     ui = G4UIExecutive(len(sys.argv), sys.argv)
 
-# Optionally: choose a different Random engine...
-# G4Random.setTheEngine(MTwistEngine())
-
-# Construct the default run manager
-runManager = G4RunManagerFactory.CreateRunManager(G4RunManagerType.Serial)
+# Use the MixMax engine: fast generation with well-separated parallel
+# streams, which matters for the MT run manager above, and its state
+# never needs to be spilled to per-event seed files (seed storage is
+# disabled in B2RunAction.BeginOfRunAction).
+G4Random.setTheEngine(MixMaxRng())
+if seed != None:
+    G4Random.setTheSeed(seed)
+
+# Construct the multithreaded run manager. Event simulation dominates the
+# runtime and events are independent, so spread them over all cores. The
+# workers share geometry/physics; ConstructSDandField and
+# B2ActionInitialization.Build run once per worker thread, which keeps the
+# sensitive detector and hits collections thread-local.
+runManager = G4RunManagerFactory.CreateRunManager(G4RunManagerType.MT)
+runManager.SetNumberOfThreads(os.cpu_count())
 
 # Set mandatory initialization classes
 runManager.SetUserInitialization(B2aDetectorConstruction())
 
-physicsList = FTFP_BERT()
-physicsList.RegisterPhysics(G4StepLimiterPhysics())
+physicsList = _make_physics_list()
 runManager.SetUserInitialization(physicsList)
 
 # Set user action classes
 runManager.SetUserInitialization(B2ActionInitialization())
 
-# Initialize visualization
-visManager = G4VisExecutive()
-# G4VisExecutive can take a verbosity argument - see /vis/verbose guidance.
-# visManager = G4VisExecutive("Quiet");
-visManager.Initialize()
+# Initialize visualization only for interactive sessions; batch runs skip
+# building the vis manager (and executing vis.mac) entirely, which saves
+# noticeable startup time and avoids trajectory storage overhead.
+visManager = None
+if ui != None:
+    visManager = G4VisExecutive()
+    # G4VisExecutive can take a verbosity argument - see /vis/verbose guidance.
+    # visManager = G4VisExecutive("Quiet");
+    visManager.Initialize()
 
 # Get the pointer to the User Interface manager
 UImanager = G4UImanager.GetUIpointer()
 
 # Process macro or start UI session
-# if ui == None:
-#     # batch mode
-#     command = "/control/execute "
-#     fileName = sys.argv[1]
-#     UImanager.ApplyCommand(command+fileName)
-# else:
+if ui == None:
+    # batch mode
+    command = "/control/execute "
+    fileName = sys.argv[1]
+    UImanager.ApplyCommand(command+fileName)
+else:
     # interactive mode
-# UImanager.ApplyCommand("/control/execute init_vis.mac")
-UImanager.ApplyCommand("/control/execute vis.mac")
-UImanager.ApplyCommand("/control/execute run1.mac")
-if ui.IsGUI():
-    UImanager.ApplyCommand("/control/execute gui.mac")
-ui.SessionStart()
+    UImanager.ApplyCommand("/control/execute vis.mac")
+    UImanager.ApplyCommand("/control/execute run1.mac")
+    if ui.IsGUI():
+        UImanager.ApplyCommand("/control/execute gui.mac")
+    ui.SessionStart()